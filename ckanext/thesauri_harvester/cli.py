@@ -1,15 +1,22 @@
 import click
 import json
 from sqlalchemy.orm import sessionmaker
-from ckan.model.meta import engine
 from ckanext.thesauri_harvester.model.thesauri_model import ThesaurusWord
-from ckanext.thesauri_harvester.lib.thesauri_processor import (
-    main as process_thesaurus_main,
-)
 from sqlalchemy.exc import IntegrityError
 
-# Setup a sessionmaker
-Session = sessionmaker(bind=engine)
+
+def _make_session():
+    """Create a standalone session bound to CKAN's engine."""
+    from ckan.model.meta import engine
+
+    return sessionmaker(bind=engine)()
+
+
+def process_thesaurus_main():
+    """Run the RDF harvest, importing rdflib only when a command needs it."""
+    from ckanext.thesauri_harvester.lib.thesauri_processor import main
+
+    main()
 
 
 @click.group()
@@ -27,7 +34,7 @@ def populate_database_from_json(filepath):
         click.echo(f"Error: Could not read or decode the JSON file at {filepath}. {e}")
         return
 
-    session = Session()
+    session = _make_session()
     try:
         # Flush database table
         session.query(ThesaurusWord).delete()
@@ -45,6 +52,24 @@ def populate_database_from_json(filepath):
     except Exception as e:
         session.rollback()
         click.echo(f"Error populating the thesaurus table: {e}")
+        return
+    finally:
+        session.close()
+
+    refresh_popularity()
+
+
+def refresh_popularity():
+    """Refresh the popularity used to rank the thesaurus words."""
+    from ckanext.thesauri_harvester.lib.popularity import update_popularity
+
+    session = _make_session()
+    try:
+        changed = update_popularity(session)
+        click.echo(f"Updated the popularity of {changed} thesaurus words.")
+    except Exception as e:
+        session.rollback()
+        click.echo(f"Error updating the thesaurus word popularity: {e}")
     finally:
         session.close()
 
@@ -92,5 +117,35 @@ def harvest_and_process():
         )
 
 
+@thesauri_harvester.command("harvest-background")
+@click.option("--shards", default=4, show_default=True, help="Number of shard jobs to fan the crawl out to.")
+@click.option("--queue", default=None, help="CKAN job queue to use instead of the default one.")
+@click.option("--force", is_flag=True, help="Supersede a harvest that is still running.")
+def harvest_background(shards, queue, force):
+    """
+    Enqueues a sharded harvest on CKAN's job queue. Run `ckan jobs worker` to process it
+    and the `thesaurus_harvest_status` action to follow its progress.
+    """
+    from ckanext.thesauri_harvester.lib.harvest_jobs import (
+        HarvestInProgress,
+        start_harvest,
+    )
+
+    try:
+        harvest = start_harvest(shard_count=shards, queue=queue, force=force)
+    except HarvestInProgress as e:
+        # Exit non-zero so that schedulers notice the refused run
+        raise click.ClickException(f"{e} Use --force to start a new harvest anyway.")
+    click.echo(f"Enqueued thesaurus harvest {harvest.id} with up to {harvest.shard_count} shards.")
+
+
+@thesauri_harvester.command("update-popularity")
+def update_popularity_command():
+    """
+    Refreshes the usage popularity used to rank thesaurus suggestions. Run it regularly, e.g. from cron.
+    """
+    refresh_popularity()
+
+
 def get_commands():
     return [thesauri_harvester]
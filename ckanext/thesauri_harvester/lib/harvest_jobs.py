@@ -0,0 +1,338 @@
+import datetime
+import json
+import logging
+
+from rdflib import Graph, namespace
+import ckan.model as model
+import ckan.plugins.toolkit as toolkit
+from sqlalchemy import func, text
+
+from ckanext.thesauri_harvester.lib.popularity import update_popularity
+from ckanext.thesauri_harvester.lib.thesauri_processor import (
+    Config,
+    ThesauriProcessor,
+    ThesauriReorganizer,
+)
+from ckanext.thesauri_harvester.model.thesauri_model import (
+    ThesaurusHarvest,
+    ThesaurusHarvestShard,
+    ThesaurusWord,
+)
+
+log = logging.getLogger(__name__)
+
+# Bounds the hierarchy levels the planning job crawls itself before sharding
+PLAN_MAX_DEPTH = 5
+
+
+class HarvestInProgress(Exception):
+    """
+    Raised when a harvest is started while another one is still active.
+    """
+
+
+def start_harvest(shard_count=4, root_concept=None, queue=None, force=False):
+    """
+    Records a new harvest and enqueues the job that plans its shards.
+
+    Args:
+        shard_count (int): The number of shard jobs to fan the crawl out to.
+        root_concept (str): The concept to crawl from, defaults to Config.root_concept.
+        queue (str): The CKAN job queue to use, defaults to CKAN's default queue.
+        force (bool): Supersede a harvest that is still active instead of refusing.
+            Active harvests without progress for twice the job timeout are
+            considered stale and always superseded.
+
+    Returns:
+        ThesaurusHarvest: The new harvest.
+    """
+    session = model.Session
+    _lock_harvests(session)
+    active = (
+        session.query(ThesaurusHarvest)
+        .filter(ThesaurusHarvest.status.in_(ThesaurusHarvest.ACTIVE))
+        .all()
+    )
+    stale_before = datetime.datetime.utcnow() - datetime.timedelta(
+        seconds=2 * _job_timeout()
+    )
+    stale = [h for h in active if _last_activity(session, h) < stale_before]
+    running = [h for h in active if h not in stale]
+    if running and not force:
+        session.rollback()
+        raise HarvestInProgress(
+            f"Harvest {running[0].id} is still {running[0].status}."
+        )
+
+    harvest = ThesaurusHarvest(
+        root_concept=root_concept or Config.root_concept,
+        shard_count=max(1, shard_count),
+        status=ThesaurusHarvest.PENDING,
+    )
+    session.add(harvest)
+    session.flush()
+    for previous in active:
+        previous.status = ThesaurusHarvest.FAILED
+        previous.error = (
+            f"Stale without progress, superseded by harvest {harvest.id}."
+            if previous in stale
+            else f"Superseded by harvest {harvest.id}."
+        )
+        previous.finished = datetime.datetime.utcnow()
+    session.commit()
+
+    try:
+        _enqueue(plan_harvest, [harvest.id, queue], f"Thesaurus harvest {harvest.id}", queue)
+    except Exception as e:
+        # Don't leave a pending harvest behind to block every later run
+        _fail(harvest, f"Could not enqueue the harvest: {e}")
+        raise
+    return harvest
+
+
+def plan_harvest(harvest_id, queue=None):
+    """
+    Job: splits the crawl under the root concept into subtree shards and
+    enqueues one job per shard.
+
+    The hierarchy is expanded level by level until there are at least as
+    many subtrees as shards; the widest level seen is then dealt
+    round-robin to the shards. Terms of the concepts visited while planning
+    are kept on the harvest and merged with the shard results at the end.
+    """
+    session = model.Session
+    harvest = session.query(ThesaurusHarvest).get(harvest_id)
+    if harvest is None or harvest.status != ThesaurusHarvest.PENDING:
+        return
+    harvest.status = ThesaurusHarvest.RUNNING
+    session.commit()
+
+    try:
+        graph, frontier = _expand(harvest.root_concept, harvest.shard_count)
+        harvest.terms = json.dumps(_graph_terms(graph), ensure_ascii=False)
+        shard_count = min(harvest.shard_count, len(frontier))
+        shards = [
+            ThesaurusHarvestShard(
+                harvest_id=harvest.id,
+                concepts=json.dumps(frontier[i::shard_count]),
+                status=ThesaurusHarvestShard.PENDING,
+            )
+            for i in range(shard_count)
+        ]
+        session.add_all(shards)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        _fail(harvest, f"Planning failed: {e}")
+        raise
+
+    log.info(
+        f"Harvest {harvest.id}: {len(frontier)} subtrees split into {len(shards)} shards"
+    )
+    if not shards:
+        _finish(harvest.id)
+        return
+    try:
+        for shard in shards:
+            _enqueue(
+                harvest_shard,
+                [shard.id],
+                f"Thesaurus harvest {harvest.id} shard {shard.id}",
+                queue,
+            )
+    except Exception as e:
+        _fail(harvest, f"Could not enqueue the shards: {e}")
+        raise
+
+
+def harvest_shard(shard_id):
+    """
+    Job: crawls the subtrees of one shard and stores their terms. The last
+    shard to finish merges the results into the final snapshot.
+    """
+    session = model.Session
+    shard = session.query(ThesaurusHarvestShard).get(shard_id)
+    if shard is None:
+        return
+    harvest = session.query(ThesaurusHarvest).get(shard.harvest_id)
+    if harvest.status != ThesaurusHarvest.RUNNING:
+        # The harvest failed or was superseded while this job was queued
+        return
+    shard.status = ThesaurusHarvestShard.RUNNING
+    shard.started = datetime.datetime.utcnow()
+    session.commit()
+
+    try:
+        processor = _processor(harvest.root_concept)
+        graph = Graph()
+        for concept in json.loads(shard.concepts):
+            graph += processor.accumulate_graph(f"{concept}.ttl", 0)
+        if processor.failed_urls:
+            # A partial subtree must not replace the complete word list
+            raise RuntimeError(
+                f"Could not load {len(processor.failed_urls)} concepts, "
+                f"first {processor.failed_urls[0]}"
+            )
+        shard.terms = json.dumps(_graph_terms(graph), ensure_ascii=False)
+        shard.concepts_processed = processor.concept_counter
+        shard.status = ThesaurusHarvestShard.COMPLETE
+    except Exception as e:
+        session.rollback()
+        log.exception(f"Harvest {harvest.id}: shard {shard.id} failed")
+        shard.status = ThesaurusHarvestShard.FAILED
+        shard.error = str(e)
+    shard.finished = datetime.datetime.utcnow()
+    session.commit()
+
+    _finish(harvest.id)
+
+
+def _finish(harvest_id):
+    """
+    Marks the harvest failed if a shard failed, or merges it once all
+    shards are complete. The harvest row is locked so that exactly one of
+    the workers finishing concurrently performs the merge.
+    """
+    session = model.Session
+    # Drop cached rows so the shard statuses written by other workers are seen
+    session.expire_all()
+    harvest = (
+        session.query(ThesaurusHarvest)
+        .filter_by(id=harvest_id)
+        .with_for_update()
+        .one()
+    )
+    shards = session.query(ThesaurusHarvestShard).filter_by(harvest_id=harvest_id).all()
+
+    if harvest.status != ThesaurusHarvest.RUNNING:
+        session.commit()
+        return
+    failed = [shard for shard in shards if shard.status == ThesaurusHarvestShard.FAILED]
+    if failed:
+        _fail(harvest, f"Shard {failed[0].id} failed: {failed[0].error}")
+        return
+    if any(shard.status != ThesaurusHarvestShard.COMPLETE for shard in shards):
+        session.commit()
+        return
+
+    harvest.status = ThesaurusHarvest.MERGING
+    session.commit()
+
+    try:
+        terms = set(json.loads(harvest.terms or "[]"))
+        for shard in shards:
+            terms.update(json.loads(shard.terms))
+        snapshot = sorted(terms)
+
+        session.query(ThesaurusWord).delete()
+        session.add_all(ThesaurusWord(word=term) for term in snapshot)
+        # The snapshot now lives in the word table, keep only its size
+        harvest.term_count = len(snapshot)
+        harvest.terms = None
+        for shard in shards:
+            shard.terms = None
+        harvest.status = ThesaurusHarvest.COMPLETE
+        harvest.finished = datetime.datetime.utcnow()
+        # Rank the new words within the same transaction, which it commits
+        session.flush()
+        update_popularity(session)
+    except Exception as e:
+        session.rollback()
+        _fail(harvest, f"Merge failed: {e}")
+        raise
+
+    log.info(f"Harvest {harvest.id}: populated {len(snapshot)} thesaurus words")
+
+
+def _fail(harvest, error):
+    log.error(f"Harvest {harvest.id}: {error}")
+    harvest.status = ThesaurusHarvest.FAILED
+    harvest.error = error
+    harvest.finished = datetime.datetime.utcnow()
+    model.Session.commit()
+
+
+def _expand(root_concept, shard_count):
+    """
+    Walks the hierarchy breadth-first until a level holds at least
+    shard_count concepts, the leaves are reached or PLAN_MAX_DEPTH levels
+    were crawled. Narrower levels along the way, e.g. a root with a single
+    child, are walked through rather than stopped at.
+
+    Returns:
+        tuple: The graph of the visited concepts and the widest level's concept URIs.
+    """
+    processor = _processor(root_concept)
+    graph = Graph()
+    frontier = widest = [root_concept]
+    depth = 0
+    while len(frontier) < shard_count and depth < PLAN_MAX_DEPTH:
+        narrower = []
+        for concept in frontier:
+            g = Graph()
+            if not processor.parse_with_retry(g, f"{concept}.ttl"):
+                raise RuntimeError(f"Could not load {concept}.ttl")
+            graph += g
+            narrower.extend(
+                o.toPython() for s, p, o in g.triples((None, namespace.SKOS.narrower, None))
+            )
+        narrower = list(dict.fromkeys(narrower))
+        if not narrower:
+            break
+        frontier = narrower
+        depth += 1
+        if len(frontier) > len(widest):
+            widest = frontier
+    # Shards re-crawl from the widest level, which covers everything below it
+    return graph, widest
+
+
+def _graph_terms(graph):
+    if not len(graph):
+        return []
+    data = json.loads(graph.serialize(format="json-ld"))
+    return list(ThesauriReorganizer(None, None).flatten_data(data))
+
+
+def _processor(root_concept):
+    return ThesauriProcessor(
+        root_concept, Config.output_format, None, Config.request_limit
+    )
+
+
+def _lock_harvests(session):
+    """
+    Serializes harvest starts until the end of the transaction, so that two
+    overlapping scheduled runs cannot both pass the active harvest check.
+    """
+    if session.get_bind().dialect.name == "postgresql":
+        session.execute(
+            text("SELECT pg_advisory_xact_lock(hashtext(:key))"),
+            {"key": ThesaurusHarvest.__tablename__},
+        )
+
+
+def _last_activity(session, harvest):
+    started, finished = (
+        session.query(
+            func.max(ThesaurusHarvestShard.started),
+            func.max(ThesaurusHarvestShard.finished),
+        )
+        .filter_by(harvest_id=harvest.id)
+        .one()
+    )
+    return max(t for t in (harvest.created, started, finished) if t is not None)
+
+
+def _job_timeout():
+    return toolkit.asint(
+        toolkit.config.get("ckanext.thesauri_harvester.job_timeout", 3600)
+    )
+
+
+def _enqueue(fn, args, title, queue):
+    options = {"title": title, "rq_kwargs": {"timeout": _job_timeout()}}
+    # CKAN only falls back to its default queue when no queue is passed
+    if queue:
+        options["queue"] = queue
+    toolkit.enqueue_job(fn, args, **options)
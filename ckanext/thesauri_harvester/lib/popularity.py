@@ -0,0 +1,47 @@
+import ckan.model as model
+from sqlalchemy import and_, distinct, func, select
+
+from ckanext.thesauri_harvester.model.thesauri_model import ThesaurusWord
+
+
+def update_popularity(session):
+    """
+    Refreshes the precomputed popularity of the thesaurus words, i.e. the
+    number of active datasets carrying each word as a tag.
+
+    The counts are compared and written in a single UPDATE ... FROM
+    statement inside the database, which only touches the rows whose
+    count changed since the last refresh.
+
+    Args:
+        session (Session): The SQLAlchemy session to update with.
+
+    Returns:
+        int: The number of updated words.
+    """
+    words = ThesaurusWord.__table__
+    tag = model.tag_table
+    package_tag = model.package_tag_table
+    package = model.package_table
+
+    tagged = tag.join(
+        package_tag,
+        and_(package_tag.c.tag_id == tag.c.id, package_tag.c.state == "active"),
+    ).join(
+        package,
+        and_(package.c.id == package_tag.c.package_id, package.c.state == "active"),
+    )
+    counts = (
+        select(words.c.id, func.count(distinct(package.c.id)).label("datasets"))
+        .select_from(words.outerjoin(tagged, tag.c.name == words.c.word))
+        .group_by(words.c.id)
+        .subquery()
+    )
+    result = session.execute(
+        words.update()
+        .values(popularity=counts.c.datasets)
+        .where(words.c.id == counts.c.id)
+        .where(words.c.popularity.is_distinct_from(counts.c.datasets))
+    )
+    session.commit()
+    return result.rowcount
@@ -30,6 +30,7 @@ class ThesauriProcessor:
         self.output_file = output_file
         self.request_limit = request_limit
         self.concept_counter = 0
+        self.failed_urls = []
         self.processed_requests = 0
         self.retry_limit = 5
         self.retry_delay = 5
@@ -87,6 +88,7 @@ class ThesauriProcessor:
         success = self.parse_with_retry(g, url)
         if not success:
             print(f"Failed to load {url} after {self.retry_limit} attempts.")
+            self.failed_urls.append(url)
             return g
 
         self.concept_counter += 1
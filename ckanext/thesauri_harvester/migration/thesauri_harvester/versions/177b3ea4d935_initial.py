@@ -17,8 +17,22 @@ depends_on = None
 
 
 def upgrade():
-    pass
+    # Installs that predate this migration already have the table, created
+    # by the plugin at startup, so only create it when it is missing.
+    bind = op.get_bind()
+    if "thesaurus_words" in sa.inspect(bind).get_table_names():
+        return
+
+    op.create_table(
+        "thesaurus_words",
+        sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+        sa.Column("word", sa.String(250), nullable=False),
+    )
+    op.create_index(
+        "ix_thesaurus_words_word", "thesaurus_words", ["word"], unique=True
+    )
 
 
 def downgrade():
-    pass
+    op.drop_index("ix_thesaurus_words_word", table_name="thesaurus_words")
+    op.drop_table("thesaurus_words")
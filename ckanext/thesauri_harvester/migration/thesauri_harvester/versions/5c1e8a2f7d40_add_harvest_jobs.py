@@ -0,0 +1,67 @@
+"""Add harvest job tables
+
+Revision ID: 5c1e8a2f7d40
+Revises: 177b3ea4d935
+Create Date: 2026-10-19 10:12:31.418204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1e8a2f7d40'
+down_revision = '177b3ea4d935'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "thesaurus_harvests",
+        sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+        sa.Column("root_concept", sa.String(250), nullable=False),
+        sa.Column("shard_count", sa.Integer, nullable=False),
+        sa.Column("status", sa.String(20), nullable=False),
+        sa.Column("terms", sa.Text),
+        sa.Column("term_count", sa.Integer),
+        sa.Column("error", sa.Text),
+        sa.Column("created", sa.DateTime),
+        sa.Column("finished", sa.DateTime),
+    )
+    op.create_index(
+        "ix_thesaurus_harvests_status", "thesaurus_harvests", ["status"]
+    )
+
+    op.create_table(
+        "thesaurus_harvest_shards",
+        sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+        sa.Column(
+            "harvest_id",
+            sa.Integer,
+            sa.ForeignKey("thesaurus_harvests.id", ondelete="CASCADE"),
+            nullable=False,
+        ),
+        sa.Column("concepts", sa.Text, nullable=False),
+        sa.Column("status", sa.String(20), nullable=False),
+        sa.Column("concepts_processed", sa.Integer),
+        sa.Column("terms", sa.Text),
+        sa.Column("error", sa.Text),
+        sa.Column("started", sa.DateTime),
+        sa.Column("finished", sa.DateTime),
+    )
+    op.create_index(
+        "ix_thesaurus_harvest_shards_harvest_id",
+        "thesaurus_harvest_shards",
+        ["harvest_id"],
+    )
+
+
+def downgrade():
+    op.drop_index(
+        "ix_thesaurus_harvest_shards_harvest_id",
+        table_name="thesaurus_harvest_shards",
+    )
+    op.drop_table("thesaurus_harvest_shards")
+    op.drop_index("ix_thesaurus_harvests_status", table_name="thesaurus_harvests")
+    op.drop_table("thesaurus_harvests")
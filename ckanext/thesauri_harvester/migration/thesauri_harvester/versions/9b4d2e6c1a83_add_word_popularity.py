@@ -0,0 +1,31 @@
+"""Add word popularity
+
+Revision ID: 9b4d2e6c1a83
+Revises: 5c1e8a2f7d40
+Create Date: 2026-10-19 14:37:02.905118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b4d2e6c1a83'
+down_revision = '5c1e8a2f7d40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "thesaurus_words",
+        sa.Column("popularity", sa.Integer, nullable=False, server_default="0"),
+    )
+    op.create_index(
+        "ix_thesaurus_words_popularity", "thesaurus_words", ["popularity"]
+    )
+
+
+def downgrade():
+    op.drop_index("ix_thesaurus_words_popularity", table_name="thesaurus_words")
+    op.drop_column("thesaurus_words", "popularity")
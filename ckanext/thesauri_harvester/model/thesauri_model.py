@@ -1,4 +1,7 @@
-from sqlalchemy import create_engine, Column, Integer, String, Index
+import datetime
+import json
+
+from sqlalchemy import create_engine, Column, Integer, String, Index, Text, DateTime, ForeignKey
 from sqlalchemy.ext.declarative import declarative_base
 from ckan.model.meta import metadata
 
@@ -9,4 +12,80 @@ class ThesaurusWord(Base):
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     word = Column(String(250), unique=True, nullable=False, index=True)
+    # Number of active datasets tagged with the word, see lib/popularity.py
+    popularity = Column(Integer, nullable=False, default=0, server_default='0', index=True)
+
+
+class ThesaurusHarvest(Base):
+    """A background harvest run, split into subtree shards."""
+    __tablename__ = 'thesaurus_harvests'
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    MERGING = 'merging'
+    COMPLETE = 'complete'
+    FAILED = 'failed'
+    ACTIVE = (PENDING, RUNNING, MERGING)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    root_concept = Column(String(250), nullable=False)
+    shard_count = Column(Integer, nullable=False)
+    status = Column(String(20), nullable=False, default=PENDING, index=True)
+    # JSON list of the planner's own terms, cleared once the harvest is merged
+    terms = Column(Text)
+    term_count = Column(Integer)
+    error = Column(Text)
+    created = Column(DateTime, default=datetime.datetime.utcnow)
+    finished = Column(DateTime)
+
+    def as_dict(self, shards):
+        return {
+            "id": self.id,
+            "root_concept": self.root_concept,
+            "status": self.status,
+            "shards_total": len(shards),
+            "shards_complete": sum(
+                1 for shard in shards if shard.status == ThesaurusHarvestShard.COMPLETE
+            ),
+            "concepts_processed": sum(shard.concepts_processed or 0 for shard in shards),
+            "term_count": self.term_count,
+            "error": self.error,
+            "created": self.created.isoformat() if self.created else None,
+            "finished": self.finished.isoformat() if self.finished else None,
+            "shards": [shard.as_dict() for shard in shards],
+        }
+
+
+class ThesaurusHarvestShard(Base):
+    """One group of subtrees of a harvest, crawled by a single job."""
+    __tablename__ = 'thesaurus_harvest_shards'
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    COMPLETE = 'complete'
+    FAILED = 'failed'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    harvest_id = Column(
+        Integer, ForeignKey('thesaurus_harvests.id', ondelete='CASCADE'),
+        nullable=False, index=True
+    )
+    # JSON list of the concept URIs whose subtrees this shard crawls
+    concepts = Column(Text, nullable=False)
+    status = Column(String(20), nullable=False, default=PENDING)
+    concepts_processed = Column(Integer, default=0)
+    terms = Column(Text)
+    error = Column(Text)
+    started = Column(DateTime)
+    finished = Column(DateTime)
 
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "concepts": json.loads(self.concepts),
+            "concepts_processed": self.concepts_processed or 0,
+            "error": self.error,
+            "started": self.started.isoformat() if self.started else None,
+            "finished": self.finished.isoformat() if self.finished else None,
+        }
@@ -2,13 +2,13 @@ from flask import Blueprint, request, jsonify  # Import jsonify here
 import ckan.model as model
 import ckan.plugins as plugins
 import ckan.plugins.toolkit as toolkit
-from ckanext.thesauri_harvester.model.thesauri_model import ThesaurusWord
-from flask import Blueprint, request
-import json
-from sqlalchemy.orm import sessionmaker
+from ckanext.thesauri_harvester.model.thesauri_model import (
+    ThesaurusWord,
+    ThesaurusHarvest,
+    ThesaurusHarvestShard,
+)
 from ckan.model import Session
 import math
-from ckanext.thesauri_harvester.cli import get_commands
 from sqlalchemy import func  # Make sure to import func
 
 
@@ -16,6 +16,7 @@ class ThesauriHarvesterPlugin(plugins.SingletonPlugin, toolkit.DefaultDatasetFor
     plugins.implements(plugins.IConfigurer)
     plugins.implements(plugins.IClick)
     plugins.implements(plugins.IActions)
+    plugins.implements(plugins.IAuthFunctions)
     plugins.implements(plugins.IBlueprint)
 
     # IConfigurer
@@ -23,19 +24,20 @@ class ThesauriHarvesterPlugin(plugins.SingletonPlugin, toolkit.DefaultDatasetFor
         toolkit.add_template_directory(config_, "templates")
         toolkit.add_public_directory(config_, "public")
         toolkit.add_resource("assets", "thesauri_harvester")
-        from ckan.model import meta
-
-        meta.metadata.create_all(
-            meta.engine, tables=[ThesaurusWord.__table__], checkfirst=True
-        )
 
     # IClick
     def get_commands(self):
+        # Imported lazily so web workers never load the harvesting stack
+        from ckanext.thesauri_harvester.cli import get_commands
+
         return get_commands()
 
     # IActions
     def get_actions(self):
-        return {"get_thesaurus_words": self.get_thesaurus_words_action}
+        return {
+            "get_thesaurus_words": self.get_thesaurus_words_action,
+            "thesaurus_harvest_status": self.thesaurus_harvest_status_action,
+        }
 
     @staticmethod
     def get_thesaurus_words_action(context, data_dict):
@@ -47,8 +49,12 @@ class ThesauriHarvesterPlugin(plugins.SingletonPlugin, toolkit.DefaultDatasetFor
         if search:
             query = query.filter(ThesaurusWord.word.ilike('%' + search + '%'))
 
-        # Add sorting by word length and then alphabetically
-        query = query.order_by(func.length(ThesaurusWord.word), ThesaurusWord.word)
+        # Rank the most used words first, then by word length and alphabetically
+        query = query.order_by(
+            ThesaurusWord.popularity.desc(),
+            func.length(ThesaurusWord.word),
+            ThesaurusWord.word,
+        )
 
         total_count = query.count()
         total_pages = math.ceil(total_count / float(per_page))
@@ -66,6 +72,47 @@ class ThesauriHarvesterPlugin(plugins.SingletonPlugin, toolkit.DefaultDatasetFor
         }
         return response
 
+    @staticmethod
+    @toolkit.side_effect_free
+    def thesaurus_harvest_status_action(context, data_dict):
+        """
+        Returns the status and shard progress of a background harvest.
+
+        :param id: the harvest id (optional, defaults to the latest harvest)
+        """
+        toolkit.check_access("thesaurus_harvest_status", context, data_dict)
+
+        query = Session.query(ThesaurusHarvest)
+        harvest_id = data_dict.get("id")
+        if harvest_id:
+            try:
+                harvest_id = toolkit.asint(harvest_id)
+            except ValueError:
+                raise toolkit.ValidationError({"id": ["Must be an integer"]})
+            harvest = query.filter_by(id=harvest_id).first()
+        else:
+            harvest = query.order_by(ThesaurusHarvest.id.desc()).first()
+        if harvest is None:
+            raise toolkit.ObjectNotFound("Thesaurus harvest not found")
+
+        shards = (
+            Session.query(ThesaurusHarvestShard)
+            .filter_by(harvest_id=harvest.id)
+            .order_by(ThesaurusHarvestShard.id)
+            .all()
+        )
+        return harvest.as_dict(shards)
+
+    # IAuthFunctions
+    def get_auth_functions(self):
+        return {"thesaurus_harvest_status": self.thesaurus_harvest_status_auth}
+
+    @staticmethod
+    def thesaurus_harvest_status_auth(context, data_dict):
+        # Harvest errors and shard concept lists are for sysadmins only,
+        # who bypass auth functions
+        return {"success": False}
+
     # IBlueprint
     def get_blueprint(self):
         blueprint = Blueprint("thesauri_harvester", self.__module__)
@@ -0,0 +1,7 @@
+import pytest
+
+
+@pytest.fixture
+def clean_db(reset_db, migrate_db_for):
+    reset_db()
+    migrate_db_for("thesauri_harvester")
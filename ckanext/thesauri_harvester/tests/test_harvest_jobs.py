@@ -0,0 +1,251 @@
+import datetime
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from click.testing import CliRunner
+import ckan.model as model
+from ckan.plugins import toolkit
+from ckan.tests import factories, helpers
+
+from ckanext.thesauri_harvester import cli
+from ckanext.thesauri_harvester.lib import harvest_jobs, thesauri_processor
+from ckanext.thesauri_harvester.model.thesauri_model import (
+    ThesaurusHarvest,
+    ThesaurusWord,
+)
+
+# concept -> (German label, narrower concepts)
+THESAURUS = {
+    "root": ("Wurzel", ["a", "b", "c"]),
+    "a": ("Keramik", ["a1", "a2"]),
+    "a1": ("Amphore", []),
+    "a2": ("Krater", ["a21"]),
+    "a21": ("Kelchkrater", []),
+    "b": ("Architektur", ["b1", "a1"]),
+    "b1": ("Tempel", []),
+    "c": ("Münzen", []),
+}
+
+TURTLE = """@prefix skos: <http://www.w3.org/2004/02/skos/core#> .
+<{base}/{concept}> skos:prefLabel "{label}"@de ; skos:prefLabel "{label}-en"@en {narrower}.
+"""
+
+
+@pytest.fixture
+def thesaurus_server():
+    """A local stand-in for thesauri.dainst.org serving THESAURUS as turtle."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            concept = self.path.strip("/").rsplit(".ttl", 1)[0]
+            if concept not in THESAURUS:
+                self.send_error(404)
+                return
+            label, narrower = THESAURUS[concept]
+            body = TURTLE.format(
+                base=base,
+                concept=concept,
+                label=label,
+                narrower="".join(f"; skos:narrower <{base}/{n}> " for n in narrower),
+            ).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/turtle")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield base
+    server.shutdown()
+
+
+@pytest.fixture
+def job_queue(monkeypatch):
+    """A local stand-in for CKAN's job queue that collects enqueued jobs."""
+    jobs = []
+
+    def enqueue_job(fn, args=None, kwargs=None, title=None, rq_kwargs=None, **options):
+        # CKAN's get_queue() fails on an explicit None
+        assert options.get("queue", "default") is not None
+        jobs.append((fn, args or [], title, options.get("queue")))
+
+    monkeypatch.setattr(toolkit, "enqueue_job", enqueue_job)
+    return jobs
+
+
+def run_jobs(jobs):
+    """Run queued jobs newest first, so shards finish out of order."""
+    while jobs:
+        fn, args, title, queue = jobs.pop()
+        fn(*args)
+
+
+ALL_TERMS = sorted(label for label, narrower in THESAURUS.values())
+
+
+@pytest.mark.ckan_config("ckan.plugins", "thesauri_harvester")
+@pytest.mark.usefixtures("clean_db", "with_plugins")
+class TestBackgroundHarvest:
+    def test_sharded_harvest_populates_merged_snapshot(self, thesaurus_server, job_queue):
+        harvest = harvest_jobs.start_harvest(
+            shard_count=3, root_concept=f"{thesaurus_server}/root", queue="thesauri"
+        )
+        assert [title for _, _, title, _ in job_queue] == [f"Thesaurus harvest {harvest.id}"]
+
+        fn, args, _, _ = job_queue.pop()
+        fn(*args)
+        assert len(job_queue) == 3
+        assert all(queue == "thesauri" for _, _, _, queue in job_queue)
+
+        status = helpers.call_action("thesaurus_harvest_status", id=harvest.id)
+        assert status["status"] == ThesaurusHarvest.RUNNING
+        assert status["shards_total"] == 3
+        assert status["shards_complete"] == 0
+
+        run_jobs(job_queue)
+
+        status = helpers.call_action("thesaurus_harvest_status")
+        assert status["id"] == harvest.id
+        assert status["status"] == ThesaurusHarvest.COMPLETE
+        assert status["shards_complete"] == 3
+        assert status["term_count"] == len(ALL_TERMS)
+        words = model.Session.query(ThesaurusWord.word).order_by(ThesaurusWord.word)
+        assert [word for word, in words] == ALL_TERMS
+        # The snapshot is only kept in the word table
+        assert model.Session.query(ThesaurusHarvest).get(harvest.id).terms is None
+
+    def test_default_queue(self, thesaurus_server, job_queue):
+        harvest_jobs.start_harvest(shard_count=3, root_concept=f"{thesaurus_server}/root")
+        fn, args, _, _ = job_queue.pop()
+        fn(*args)
+        assert [queue for _, _, _, queue in job_queue] == [None, None, None]
+
+    def test_more_shards_than_subtrees(self, thesaurus_server, job_queue):
+        harvest_jobs.start_harvest(shard_count=50, root_concept=f"{thesaurus_server}/root")
+        run_jobs(job_queue)
+
+        # The tree is never wider than the three top level subtrees
+        status = helpers.call_action("thesaurus_harvest_status")
+        assert status["status"] == ThesaurusHarvest.COMPLETE
+        assert status["shards_total"] == 3
+        assert model.Session.query(ThesaurusWord).count() == len(ALL_TERMS)
+
+    def test_narrow_levels_are_walked_through(self, thesaurus_server, job_queue, monkeypatch):
+        monkeypatch.setitem(THESAURUS, "chain", ("Kette", ["x"]))
+        monkeypatch.setitem(THESAURUS, "x", ("Zwischen", ["a", "b", "c"]))
+        harvest_jobs.start_harvest(shard_count=3, root_concept=f"{thesaurus_server}/chain")
+        run_jobs(job_queue)
+
+        status = helpers.call_action("thesaurus_harvest_status")
+        assert status["status"] == ThesaurusHarvest.COMPLETE
+        assert status["shards_total"] == 3
+        words = model.Session.query(ThesaurusWord.word).order_by(ThesaurusWord.word)
+        assert [word for word, in words] == sorted(
+            set(ALL_TERMS) - {"Wurzel"} | {"Kette", "Zwischen"}
+        )
+
+    def test_refuses_concurrent_harvest(self, thesaurus_server, job_queue):
+        first = harvest_jobs.start_harvest(root_concept=f"{thesaurus_server}/root")
+        with pytest.raises(harvest_jobs.HarvestInProgress):
+            harvest_jobs.start_harvest(root_concept=f"{thesaurus_server}/root")
+
+        second = harvest_jobs.start_harvest(
+            root_concept=f"{thesaurus_server}/root", force=True
+        )
+        run_jobs(job_queue)
+
+        assert helpers.call_action("thesaurus_harvest_status", id=first.id)["status"] == ThesaurusHarvest.FAILED
+        assert helpers.call_action("thesaurus_harvest_status", id=second.id)["status"] == ThesaurusHarvest.COMPLETE
+
+    def test_stale_harvest_is_superseded(self, thesaurus_server, job_queue):
+        stale = harvest_jobs.start_harvest(root_concept=f"{thesaurus_server}/root")
+        stale.created = datetime.datetime.utcnow() - datetime.timedelta(hours=3)
+        model.Session.commit()
+
+        harvest = harvest_jobs.start_harvest(root_concept=f"{thesaurus_server}/root")
+        run_jobs(job_queue)
+
+        status = helpers.call_action("thesaurus_harvest_status", id=stale.id)
+        assert status["status"] == ThesaurusHarvest.FAILED
+        assert "Stale" in status["error"]
+        status = helpers.call_action("thesaurus_harvest_status", id=harvest.id)
+        assert status["status"] == ThesaurusHarvest.COMPLETE
+
+    def test_cli_exits_non_zero_when_refused(self, thesaurus_server, job_queue):
+        harvest_jobs.start_harvest(root_concept=f"{thesaurus_server}/root")
+
+        result = CliRunner().invoke(cli.harvest_background, [])
+        assert result.exit_code == 1
+        assert "--force" in result.output
+
+    def test_failed_enqueue_does_not_block_next_harvest(self, thesaurus_server, job_queue, monkeypatch):
+        def broken_enqueue_job(*args, **kwargs):
+            raise ConnectionError("Redis is down")
+
+        with monkeypatch.context() as m:
+            m.setattr(toolkit, "enqueue_job", broken_enqueue_job)
+            with pytest.raises(ConnectionError):
+                harvest_jobs.start_harvest(root_concept=f"{thesaurus_server}/root")
+
+        status = helpers.call_action("thesaurus_harvest_status")
+        assert status["status"] == ThesaurusHarvest.FAILED
+        assert harvest_jobs.start_harvest(root_concept=f"{thesaurus_server}/root")
+
+    def test_unreachable_subtree_keeps_word_list(self, thesaurus_server, job_queue, monkeypatch):
+        monkeypatch.delitem(THESAURUS, "a2")
+        monkeypatch.setattr(thesauri_processor.time, "sleep", lambda seconds: None)
+        model.Session.add(ThesaurusWord(word="Bestehend"))
+        model.Session.commit()
+
+        harvest = harvest_jobs.start_harvest(
+            shard_count=3, root_concept=f"{thesaurus_server}/root"
+        )
+        run_jobs(job_queue)
+
+        status = helpers.call_action("thesaurus_harvest_status", id=harvest.id)
+        assert status["status"] == ThesaurusHarvest.FAILED
+        assert [shard["status"] for shard in status["shards"]].count("failed") == 1
+        words = model.Session.query(ThesaurusWord.word)
+        assert [word for word, in words] == ["Bestehend"]
+
+    def test_unreachable_root_fails_harvest(self, thesaurus_server, job_queue, monkeypatch):
+        monkeypatch.setattr(harvest_jobs.ThesauriProcessor, "parse_with_retry", lambda *args: False)
+        harvest = harvest_jobs.start_harvest(root_concept=f"{thesaurus_server}/root")
+        with pytest.raises(RuntimeError):
+            run_jobs(job_queue)
+
+        status = helpers.call_action("thesaurus_harvest_status", id=harvest.id)
+        assert status["status"] == ThesaurusHarvest.FAILED
+        assert "Planning failed" in status["error"]
+
+    def test_status_of_unknown_harvest(self):
+        with pytest.raises(toolkit.ObjectNotFound):
+            helpers.call_action("thesaurus_harvest_status", id=12345)
+
+    def test_status_with_invalid_id(self):
+        with pytest.raises(toolkit.ValidationError):
+            helpers.call_action("thesaurus_harvest_status", id="latest")
+
+    def test_status_requires_sysadmin(self, thesaurus_server, job_queue):
+        harvest_jobs.start_harvest(root_concept=f"{thesaurus_server}/root")
+        user = factories.User()
+        sysadmin = factories.Sysadmin()
+
+        for name in ["", user["name"]]:
+            with pytest.raises(toolkit.NotAuthorized):
+                helpers.call_action(
+                    "thesaurus_harvest_status",
+                    context={"user": name, "ignore_auth": False},
+                )
+        status = helpers.call_action(
+            "thesaurus_harvest_status",
+            context={"user": sysadmin["name"], "ignore_auth": False},
+        )
+        assert status["status"] == ThesaurusHarvest.PENDING
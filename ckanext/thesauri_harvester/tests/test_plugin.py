@@ -1,3 +1,6 @@
+import subprocess
+import sys
+
 import pytest
 from ckan.plugins import toolkit
 import ckanext.thesauri_harvester.plugin as plugin
@@ -10,3 +13,14 @@ def plugin_loaded(name):
 @pytest.mark.usefixtures("with_plugins")
 def test_plugin():
     assert plugin_loaded("thesauri_harvester")
+
+
+def test_plugin_import_does_not_load_harvester():
+    """Web workers must not pay for rdflib or the CLI when loading the plugin."""
+    code = (
+        "import sys, ckanext.thesauri_harvester.plugin; "
+        "print('rdflib' in sys.modules, "
+        "'ckanext.thesauri_harvester.cli' in sys.modules)"
+    )
+    output = subprocess.check_output([sys.executable, "-c", code], text=True)
+    assert output.split() == ["False", "False"]
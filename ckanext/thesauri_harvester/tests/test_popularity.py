@@ -0,0 +1,48 @@
+import pytest
+import ckan.model as model
+from ckan.tests import factories, helpers
+
+from ckanext.thesauri_harvester.lib.popularity import update_popularity
+from ckanext.thesauri_harvester.model.thesauri_model import ThesaurusWord
+
+
+@pytest.fixture
+def words(clean_db):
+    model.Session.add_all(
+        ThesaurusWord(word=word) for word in ["Amphore", "Krater", "Tempel"]
+    )
+    model.Session.commit()
+
+
+def popularity():
+    return dict(model.Session.query(ThesaurusWord.word, ThesaurusWord.popularity))
+
+
+@pytest.mark.ckan_config("ckan.plugins", "thesauri_harvester")
+@pytest.mark.usefixtures("words", "with_plugins")
+class TestPopularity:
+    def test_counts_active_datasets_per_tag(self):
+        factories.Dataset(tags=[{"name": "Krater"}, {"name": "Tempel"}])
+        factories.Dataset(tags=[{"name": "Krater"}, {"name": "Keramik"}])
+        deleted = factories.Dataset(tags=[{"name": "Amphore"}])
+        helpers.call_action("package_delete", id=deleted["id"])
+
+        assert update_popularity(model.Session) == 2
+        assert popularity() == {"Amphore": 0, "Krater": 2, "Tempel": 1}
+
+    def test_refresh_only_writes_changes(self):
+        dataset = factories.Dataset(tags=[{"name": "Tempel"}])
+        assert update_popularity(model.Session) == 1
+        assert update_popularity(model.Session) == 0
+
+        helpers.call_action("package_patch", id=dataset["id"], tags=[{"name": "Amphore"}])
+        assert update_popularity(model.Session) == 2
+        assert popularity() == {"Amphore": 1, "Krater": 0, "Tempel": 0}
+
+    def test_suggestions_rank_popular_words_first(self):
+        factories.Dataset(tags=[{"name": "Tempel"}])
+        factories.Dataset(tags=[{"name": "Tempel"}, {"name": "Krater"}])
+        update_popularity(model.Session)
+
+        result = helpers.call_action("get_thesaurus_words")
+        assert [word["text"] for word in result["results"]] == ["Tempel", "Krater", "Amphore"]
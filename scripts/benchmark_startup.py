@@ -0,0 +1,77 @@
+"""
+Measures what the plugin adds to every CKAN worker start: the time to import
+ckanext.thesauri_harvester.plugin and the time of its update_config call.
+
+Run it in a CKAN environment with the database up, once per revision to
+compare, e.g.:
+
+    python scripts/benchmark_startup.py --config test.ini
+    git checkout <baseline> -- ckanext
+    python scripts/benchmark_startup.py --config test.ini
+    git checkout HEAD -- ckanext
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+# CKAN and Flask are imported before the clock starts, so only the cost
+# the plugin module adds on top of them is measured.
+IMPORT_SNIPPET = """
+import time
+import flask, sqlalchemy.orm
+import ckan.model, ckan.plugins, ckan.plugins.toolkit
+start = time.perf_counter()
+import ckanext.thesauri_harvester.plugin
+print(time.perf_counter() - start)
+"""
+
+UPDATE_CONFIG_SNIPPET = """
+import sys, time
+from ckan.cli import load_config
+from ckan.config.middleware import make_app
+import ckan.plugins as plugins
+from ckan.common import config
+
+make_app(load_config(sys.argv[1]))
+plugin = plugins.get_plugin("thesauri_harvester")
+timings = []
+for _ in range(int(sys.argv[2])):
+    start = time.perf_counter()
+    plugin.update_config(config)
+    timings.append(time.perf_counter() - start)
+print(" ".join(str(t) for t in timings))
+"""
+
+
+def run(snippet, *args):
+    output = subprocess.check_output(
+        [sys.executable, "-c", snippet, *args], text=True
+    )
+    return [float(value) for value in output.split()]
+
+
+def report(name, timings):
+    print(
+        f"{name}: median {statistics.median(timings) * 1000:.2f} ms, "
+        f"min {min(timings) * 1000:.2f} ms, max {max(timings) * 1000:.2f} ms "
+        f"over {len(timings)} runs"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--config", required=True, help="CKAN ini file with the plugin enabled")
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    # Each import runs in a fresh interpreter so nothing is cached in sys.modules
+    report(
+        "plugin import",
+        [t for _ in range(args.runs) for t in run(IMPORT_SNIPPET)],
+    )
+    report("update_config", run(UPDATE_CONFIG_SNIPPET, args.config, str(args.runs)))
+
+
+if __name__ == "__main__":
+    main()